@@ -1,96 +1,571 @@
 import os
-import base64
+import re
+import html
+import json
+import atexit
+import asyncio
+import time
+import random
+import binascii
+import hashlib
 import mimetypes
+import contextlib
+import threading
 from pathlib import Path
+try:
+    import fcntl  # POSIX only; used to serialize semantic-cache appends across processes
+except ImportError:
+    fcntl = None
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from dotenv import load_dotenv
+import httpx
+import orjson
 import requests # <-- ADDED: For making API calls
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-# Load environment variables
-load_dotenv()
+# Load environment variables from .env only when the deploy environment hasn't set them.
+# This only saves the work for this module: app.main, app.github_utils and app.notify
+# still import dotenv and call load_dotenv() unconditionally.
+if not os.environ.get("OPENAI_API_KEY"):
+    from dotenv import load_dotenv
+    load_dotenv()
 # NOTE: Using OPENAI_API_KEY as the Gemini API Key as per your configuration
 GEMINI_API_KEY = os.getenv("OPENAI_API_KEY") 
 GEMINI_MODEL = "gemini-2.5-flash-preview-09-2025"
-GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
+# Cheaper/faster model for simple first-round briefs; see _choose_model
+GEMINI_LITE_MODEL = "gemini-2.5-flash-lite"
+LITE_MODEL_MAX_BRIEF_CHARS = 400
+GEMINI_API_URL_TMPL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent"
+GEMINI_API_URLS = {m: GEMINI_API_URL_TMPL.format(model=m) for m in (GEMINI_MODEL, GEMINI_LITE_MODEL)}
+README_SEPARATOR = "---README.md---"
+
+# Transient Gemini failures (rate limits, overload) are retried with jittered
+# exponential backoff, honoring Retry-After (capped), before falling back to placeholder HTML
+MAX_RETRIES = 3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_INFLIGHT_REQUESTS = 8
+MAX_RETRY_AFTER_SECONDS = 30  # a provider asking for longer still gets retried after this
+
+class _CappedRetry(Retry):
+    """
+    urllib3 Retry whose Retry-After wait is capped, so a 429 asking for an hour
+    doesn't stall a generation (and hold an in-flight slot) that long.
+    """
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, MAX_RETRY_AFTER_SECONDS)
+
+# Shared HTTP session: keeps TLS/TCP connections alive across generations
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=32,
+    max_retries=_CappedRetry(
+        total=MAX_RETRIES,
+        backoff_factor=1.0,
+        backoff_jitter=0.5,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=["POST"],
+        respect_retry_after_header=True,
+    ),
+))
+atexit.register(_session.close)
+
+# Caps concurrent Gemini calls from this process so bursts don't stampede the provider.
+# One threading semaphore shared by the sync path and every event loop, so mixed
+# sync/async use or several generate_apps calls on different threads share the cap.
+_inflight = threading.BoundedSemaphore(MAX_INFLIGHT_REQUESTS)
+
+@contextlib.asynccontextmanager
+async def _async_inflight_slot():
+    """
+    Take an _inflight slot from async code without blocking the event loop.
+    Polls a non-blocking acquire rather than using asyncio.to_thread(acquire): a
+    cancelled task can't leave a worker thread holding a slot nobody releases.
+    """
+    while not _inflight.acquire(blocking=False):
+        await asyncio.sleep(0.05)
+    try:
+        yield
+    finally:
+        _inflight.release()
 
 TMP_DIR = Path("/tmp/llm_attachments")
 TMP_DIR.mkdir(parents=True, exist_ok=True)
 
+# Cache state lives in a sibling directory, outside the attachment namespace, so no
+# attachment name can shadow or redirect (via its symlink) a cache file
+CACHE_ROOT = Path("/tmp/llm_cache")
+CACHE_ROOT.mkdir(parents=True, exist_ok=True)
+
+# Base64 decoding: prefer the SIMD-accelerated pybase64 when installed, else the C stdlib codec
+try:
+    import pybase64
+    def _b64decode(data):
+        return pybase64.b64decode(data, validate=False)
+except ImportError:
+    _b64decode = binascii.a2b_base64
+_CHUNKED_DECODE_THRESHOLD = 1 << 20  # base64 payloads above ~1 MB are decoded in chunks
+_B64_CHUNK = 1 << 16  # must stay a multiple of 4 so every chunk decodes on its own
+_MAX_WRITE = 1 << 30  # largest slice handed to a single os.write call
+
+# Decoded attachments are stored once per content hash; <name> is a symlink into here
+BLOB_DIR = CACHE_ROOT / "blobs"
+BLOB_DIR.mkdir(parents=True, exist_ok=True)
+MAX_DECODE_WORKERS = 8
+
+# Blobs unused for longer than this are swept (reuse refreshes their mtime); expired
+# prompt-cache files go in the same sweep, which runs at most once per interval
+CACHE_SWEEP_INTERVAL_SECONDS = 600
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+
+def _blob_max_age_seconds() -> int:
+    return int(os.getenv("LLM_BLOB_MAX_AGE_SECONDS", "86400"))
+
+# Exact-match prompt cache: identical inputs skip the Gemini call entirely
+CACHE_DIR = CACHE_ROOT / "prompts"
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
+# Cache settings are read at call time, not import time: the .env guard above only
+# checks OPENAI_API_KEY, and app.main calls load_dotenv() after importing this module.
+def _cache_ttl_seconds() -> int:
+    return int(os.getenv("LLM_CACHE_TTL_SECONDS", "0"))  # 0 = never expire
+
+# Semantic cache: near-identical briefs (same checks/round/context) reuse a prior generation.
+# Opt-in with LLM_SEMANTIC_CACHE=1; it needs sentence-transformers + numpy, which are
+# deliberately not in requirements.txt (they pull in torch). Lookups are one exhaustive
+# dot product over all stored embeddings; FAISS IndexFlatIP would do the same exhaustive
+# search, so it is not used even for large stores.
+def _semantic_cache_enabled() -> bool:
+    return os.getenv("LLM_SEMANTIC_CACHE", "").lower() in ("1", "true", "yes")
+
+# Append-only JSONL; each line holds the entry *and* its base64 float32 embedding
+SEMANTIC_CACHE_PATH = CACHE_ROOT / "semantic_cache.jsonl"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_EMBED_MODEL = "all-MiniLM-L6-v2"
+
+_embedder = None
+_embedder_unavailable = False
+_embedder_lock = threading.Lock()
+_semantic_lock = threading.Lock()
+_semantic_store = None  # {"matrix", "count", "entries"} once loaded; matrix has spare rows
+
+def _write_all(fd: int, data):
+    """
+    os.write may write fewer bytes than asked (and some platforms cap a single
+    write near 2 GB), so keep writing bounded slices until everything is out.
+    """
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view[:_MAX_WRITE])
+        view = view[written:]
+
+def _open_for_write(path: Path) -> int:
+    # Raw fd, no buffered writer: attachments are written once in large blocks
+    return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+def _write_file(path: Path, data):
+    fd = _open_for_write(path)
+    try:
+        _write_all(fd, data)
+    finally:
+        os.close(fd)
+
+def _decode_b64_to_file(b64, path: Path) -> int:
+    """
+    Decode a large base64 payload in fixed-size chunks, writing each piece as it is
+    decoded so the full decoded file never sits in memory. Returns the decoded size.
+    """
+    size = 0
+    fd = _open_for_write(path)
+    try:
+        for i in range(0, len(b64), _B64_CHUNK):
+            data = _b64decode(b64[i:i + _B64_CHUNK])
+            _write_all(fd, data)
+            size += len(data)
+    finally:
+        os.close(fd)
+    return size
+
+# Names of cache entries, rejected as attachment names as a second line of defence
+# should TMP_DIR and CACHE_ROOT ever point at the same directory
+_RESERVED_ATTACHMENT_NAMES = frozenset({
+    BLOB_DIR.name, CACHE_DIR.name, SEMANTIC_CACHE_PATH.name,
+})
+
+def _is_safe_attachment_name(name: str) -> bool:
+    # Attachment names come from the request; never let them escape TMP_DIR,
+    # collide with cache state, or look like _link_attachment's temp symlinks
+    if name in (".", "..") or "/" in name or "\\" in name or "\0" in name:
+        return False
+    if name in _RESERVED_ATTACHMENT_NAMES:
+        return False
+    return not (name.startswith(".") and name.endswith(".lnk"))
+
+def _decode_to_blob(b64, raw: bytes, blob: Path) -> int:
+    """
+    Decode into a temp file and rename it into place, so a crash or a concurrent
+    decode never leaves a truncated blob that later requests would reuse.
+    """
+    tmp = blob.with_name(f"{blob.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        # Chunk boundaries are only valid when the payload has no embedded whitespace
+        if len(b64) > _CHUNKED_DECODE_THRESHOLD and not any(ws in raw for ws in (b"\n", b"\r", b" ")):
+            size = _decode_b64_to_file(b64, tmp)
+        else:
+            data = _b64decode(b64)
+            _write_file(tmp, data)
+            size = len(data)
+        os.replace(tmp, blob)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return size
+
+def _link_attachment(blob: Path, path: Path):
+    # Build the symlink aside and rename it over <name>, replacing any previous file
+    tmp_link = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.lnk")
+    os.symlink(blob, tmp_link)
+    os.replace(tmp_link, path)
+
+def _decode_one(att):
+    """
+    Decode and save a single attachment; returns its saved-info dict or None if skipped.
+    """
+    name = att.get("name") or "attachment"
+    url = att.get("url", "")
+    if not url.startswith("data:"):
+        return None
+    if not _is_safe_attachment_name(name):
+        print("Skipping attachment with unsafe name", repr(name))
+        return None
+    try:
+        # Work on bytes and slice through a memoryview so the (possibly multi-MB)
+        # payload is not copied again before decoding
+        raw = url.encode("ascii", "ignore")
+        comma = raw.find(b",")
+        if comma < 0:
+            raise ValueError("data URL has no ',' separator")
+        header = raw[:comma]
+        semi = header.find(b";")
+        mime = header[5:semi if semi >= 0 else comma].decode("ascii")
+        b64 = memoryview(raw)[comma + 1:]
+        path = TMP_DIR / name
+        # Same payload as an earlier request/round: reuse the decoded blob
+        blob = BLOB_DIR / hashlib.sha256(b64).hexdigest()[:32]
+        try:
+            # Touch on reuse so the age sweep only evicts blobs nobody has sent lately
+            os.utime(blob)
+            size = blob.stat().st_size
+        except FileNotFoundError:
+            size = _decode_to_blob(b64, raw, blob)
+        _link_attachment(blob, path)
+        return {
+            "name": name,
+            "path": str(path),
+            "mime": mime,
+            "size": size
+        }
+    except Exception as e:
+        print("Failed to decode attachment", name, e)
+        return None
+
+def _remove_older_than(directory: Path, cutoff: float):
+    for entry in os.scandir(directory):
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                os.unlink(entry.path)
+        except OSError:
+            pass
+
+def _sweep_caches():
+    """
+    Evict stale blobs, expired prompt-cache files and attachment symlinks left
+    dangling by either, so /tmp doesn't grow for the life of the service.
+    """
+    global _last_sweep
+    now = time.time()
+    with _sweep_lock:
+        if now - _last_sweep < CACHE_SWEEP_INTERVAL_SECONDS:
+            return
+        _last_sweep = now
+    try:
+        _remove_older_than(BLOB_DIR, now - _blob_max_age_seconds())
+        ttl = _cache_ttl_seconds()
+        if ttl:
+            _remove_older_than(CACHE_DIR, now - ttl)
+        for entry in os.scandir(TMP_DIR):
+            if entry.is_symlink() and not os.path.exists(entry.path):
+                os.unlink(entry.path)
+    except OSError as e:
+        print("Cache sweep failed", e)
+
 def decode_attachments(attachments):
     """
     attachments: list of {name, url: data:<mime>;base64,<b64>}
-    Saves files into /tmp/llm_attachments/<name>
+    Saves files into /tmp/llm_attachments/<name> (a symlink to a content-addressed blob,
+    so identical payloads are decoded and written only once)
     Returns list of dicts: {"name": name, "path": "/tmp/..", "mime": mime, "size": n}
     """
-    saved = []
-    for att in attachments or []:
-        name = att.get("name") or "attachment"
-        url = att.get("url", "")
-        if not url.startswith("data:"):
-            continue
-        try:
-            # Handle potential filename sanitization if needed, but for now use as-is
-            header, b64data = url.split(",", 1)
-            mime = header.split(";")[0].replace("data:", "")
-            data = base64.b64decode(b64data)
-            path = TMP_DIR / name
-            with open(path, "wb") as f:
-                f.write(data)
-            saved.append({
-                "name": name,
-                "path": str(path),
-                "mime": mime,
-                "size": len(data)
-            })
-        except Exception as e:
-            print("Failed to decode attachment", name, e)
-    return saved
+    _sweep_caches()
+    attachments = attachments or []
+    if len(attachments) <= 1:
+        return [s for s in map(_decode_one, attachments) if s]
+    # hashing, base64 decoding and file writes all release the GIL on large buffers,
+    # so decoding several attachments in threads overlaps most of the work
+    with ThreadPoolExecutor(max_workers=min(MAX_DECODE_WORKERS, len(attachments))) as ex:
+        return [s for s in ex.map(_decode_one, attachments) if s]
 
-def summarize_attachment_meta(saved):
+_TEXT_EXTS = frozenset({".md", ".txt", ".json", ".csv"})
+
+def _is_text_ext(mime: str, ext: str) -> bool:
+    return mime.startswith("text") or ext in _TEXT_EXTS
+
+def is_text_attachment(name: str, mime: str) -> bool:
+    """
+    True if an attachment should be treated as text (by mime type or extension).
+    """
+    return _is_text_ext(mime, os.path.splitext(name)[1].lower())
+
+MAX_ATTACHMENTS_META_CHARS = 2048  # total prompt budget for attachment summaries
+
+def summarize_attachment_meta(saved, max_preview_bytes=256):
     """
     saved is list from decode_attachments.
     Returns a short human-readable summary string for the prompt.
+    Each text preview is capped at max_preview_bytes; if the whole summary would still
+    exceed MAX_ATTACHMENTS_META_CHARS, previews are dropped and only name/mime/size kept.
     """
     summaries = []
+    short_summaries = []
+    previews = 0
     for s in saved:
         nm = s["name"]
         p = s["path"]
         mime = s.get("mime", "")
+        short = f"- {nm} ({mime}): {s['size']} bytes"
+        ext = os.path.splitext(nm)[1].lower()
         try:
-            if mime.startswith("text") or nm.endswith((".md", ".txt", ".json", ".csv")):
-                with open(p, "r", encoding="utf-8", errors="ignore") as f:
-                    if nm.endswith(".csv"):
-                        # Read only a few lines for CSV preview
-                        f.seek(0)
-                        lines = [next(f).strip() for _ in range(min(3, sum(1 for line in f))) if f.tell() < 1000]
-                        f.seek(0) # Reset pointer
-                        preview = "\\n".join(lines)
-                    else:
-                        data = f.read(1000)
-                        preview = data.replace("\n", "\\n")[:1000]
+            if _is_text_ext(mime, ext):
+                # One bounded read on a raw fd; no buffered reader, and never more than
+                # max_preview_bytes even for a CSV with a huge (or no) line break
+                fd = os.open(p, os.O_RDONLY)
+                try:
+                    data = os.read(fd, max_preview_bytes).decode("utf-8", "ignore")
+                finally:
+                    os.close(fd)
+                if ext == ".csv":
+                    # Only the first few rows are useful for a CSV preview
+                    preview = "\\n".join(data.splitlines()[:3])
+                else:
+                    preview = data.replace("\n", "\\n")
                 summaries.append(f"- {nm} ({mime}): preview: {preview}")
+                previews += 1
             else:
-                summaries.append(f"- {nm} ({mime}): {s['size']} bytes (Binary file, use as-is or encode to b64 if needed)")
+                short = f"- {nm} ({mime}): {s['size']} bytes (Binary file, use as-is or encode to b64 if needed)"
+                summaries.append(short)
         except Exception as e:
             summaries.append(f"- {nm} ({mime}): (could not read preview: {e})")
-    return "\\n".join(summaries)
+        short_summaries.append(short)
+
+    joined = "\\n".join(summaries)
+    if len(joined) > MAX_ATTACHMENTS_META_CHARS and previews:
+        # Previews inflate prompt tokens (and prefill time); fall back to metadata only
+        joined = "\\n".join(short_summaries + [f"({previews} previews omitted due to size)"])
+    return joined
 
-def _strip_code_block(text: str) -> str:
+# A fence only counts when it opens the section (after optional whitespace); a fence
+# later on (e.g. a Setup snippet in an unfenced README) is content, not a wrapper.
+# The language line may end in CRLF.
+_FENCE_OPEN = r"\s*```(?:[\w+-]*[ \t]*\r?\n)?"
+# Whole section wrapped: take everything up to the *last* fence, so fenced snippets
+# inside a fenced README survive
+_WRAPPED_FENCE_RE = re.compile(_FENCE_OPEN + r"(.*)```\s*\Z", re.DOTALL)
+# Otherwise: body up to the first closing fence, or to the end if never closed
+_FENCE_RE = re.compile(_FENCE_OPEN + r"(.*?)(?:```|\Z)", re.DOTALL)
+
+def _strip_code_block(text: str, start: int = 0, end: int = None) -> str:
     """
     If text is inside triple-backticks, return inner contents. Otherwise return text as-is.
     Also handles optional language specifier (e.g., ```html).
+    start/end restrict the scan to text[start:end] without slicing the buffer first.
+    """
+    if end is None:
+        end = len(text)
+    m = _WRAPPED_FENCE_RE.match(text, start, end) or _FENCE_RE.match(text, start, end)
+    return m.group(1).strip() if m else text[start:end].strip()
+
+def _prompt_cache_key(brief, checks, round_num, prev_readme, attachments_meta, model=GEMINI_MODEL):
+    """
+    Deterministic SHA-256 key over everything that influences the generated output.
+    """
+    key_data = {
+        "brief": brief,
+        "checks": checks or [],
+        "round_num": round_num,
+        "prev_readme": prev_readme or "",
+        "attachments_meta": attachments_meta,
+        "model": model,
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _load_cached_result(cache_path: Path):
+    """
+    Return the cached result dict, or None if missing, expired or unreadable.
+    """
+    if not cache_path.exists():
+        return None
+    ttl = _cache_ttl_seconds()
+    if ttl and time.time() - cache_path.stat().st_mtime > ttl:
+        cache_path.unlink(missing_ok=True)
+        return None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def _store_cached_result(cache_path: Path, result: dict):
+    try:
+        # Write to a per-writer temp file first so neither a concurrent reader nor a
+        # concurrent writer of the same prompt ever sees a partial JSON
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print("Failed to write prompt cache", cache_path.name, e)
+
+def _semantic_context_key(checks, round_num, prev_readme, attachments_meta, model=GEMINI_MODEL):
+    """
+    Everything except the brief must match exactly for a semantic cache hit.
+    """
+    key_data = {
+        "checks": checks or [],
+        "round_num": round_num,
+        "prev_readme": prev_readme or "",
+        "attachments_meta": attachments_meta,
+        "model": model,
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _get_embedder():
+    """
+    Lazy-load the sentence embedding model on first use.
+    None if the semantic cache is not enabled or its packages are not installed.
+    """
+    global _embedder, _embedder_unavailable
+    if not _semantic_cache_enabled():
+        return None
+    # Locked because async batches look up the cache from several worker threads at once
+    with _embedder_lock:
+        if _embedder is None and not _embedder_unavailable:
+            try:
+                from sentence_transformers import SentenceTransformer
+                _embedder = SentenceTransformer(SEMANTIC_EMBED_MODEL)
+            except Exception as e:
+                print("Semantic cache disabled:", e)
+                _embedder_unavailable = True
+    return _embedder
+
+def _embed_brief(brief: str):
+    embedder = _get_embedder()
+    if embedder is None:
+        return None
+    # Normalized embeddings make the dot product equal to cosine similarity
+    return embedder.encode([brief], normalize_embeddings=True)[0].astype("float32")
+
+def _load_semantic_store(dim: int):
+    """
+    Load the on-disk store into a preallocated matrix. Every record carries its own
+    embedding, so a torn or foreign-dimension line is simply skipped and can never
+    shift the brief -> cached-app pairing of the records after it.
     """
-    if "```" in text:
-        parts = text.split("```")
-        # Find the first non-empty part after the opening ```
-        for part in parts[1:]:
-            if part.strip():
-                # Strip optional language identifier (e.g., 'html\n')
-                lines = part.split('\n', 1)
-                if len(lines) > 1 and not lines[0].strip().startswith('<'):
-                    return lines[1].strip()
-                return part.strip()
-    return text.strip()
+    global _semantic_store
+    if _semantic_store is None:
+        import numpy as np
+        vectors, entries = [], []
+        try:
+            with open(SEMANTIC_CACHE_PATH, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        vector = np.frombuffer(binascii.a2b_base64(record["embedding"]), dtype=np.float32)
+                        entry = {"context": record["context"], "cache_file": record["cache_file"]}
+                    except (ValueError, KeyError, TypeError, binascii.Error):
+                        continue
+                    if vector.shape[0] == dim:
+                        vectors.append(vector)
+                        entries.append(entry)
+        except OSError:
+            pass
+        count = len(entries)
+        matrix = np.empty((max(count, 64), dim), dtype=np.float32)
+        if count:
+            matrix[:count] = np.stack(vectors)
+        _semantic_store = {"matrix": matrix, "count": count, "entries": entries}
+    return _semantic_store
+
+def _append_semantic_record(line: bytes):
+    """
+    Append one complete record with a single O_APPEND write, under an exclusive
+    file lock where available, so concurrent processes never interleave records.
+    """
+    fd = os.open(SEMANTIC_CACHE_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        _write_all(fd, line)
+    finally:
+        os.close(fd)  # also releases the flock
+
+def _semantic_cache_lookup(embedding, context_key):
+    """
+    Return the cached result of the most similar prior brief with the same context, if any.
+    """
+    import numpy as np
+    with _semantic_lock:
+        store = _load_semantic_store(embedding.shape[0])
+        count, entries = store["count"], store["entries"]
+        if not count:
+            return None
+        sims = store["matrix"][:count] @ embedding
+        mask = np.fromiter((e["context"] == context_key for e in entries), dtype=bool, count=count)
+        if not mask.any():
+            return None
+        sims[~mask] = -1.0
+        best = int(np.argmax(sims))
+        if sims[best] < SEMANTIC_CACHE_THRESHOLD:
+            return None
+        cache_file = entries[best]["cache_file"]
+    return _load_cached_result(CACHE_DIR / cache_file)
+
+def _semantic_cache_add(embedding, context_key, cache_path: Path):
+    """
+    Append one record (embedding + entry together). The in-memory matrix grows by
+    doubling and the file is only appended to, so each add is amortized O(1).
+    """
+    import numpy as np
+    embedding = embedding.astype(np.float32)
+    entry = {"context": context_key, "cache_file": cache_path.name}
+    record = dict(entry, embedding=binascii.b2a_base64(embedding.tobytes(), newline=False).decode("ascii"))
+    with _semantic_lock:
+        store = _load_semantic_store(embedding.shape[0])
+        try:
+            _append_semantic_record((json.dumps(record) + "\n").encode("utf-8"))
+        except OSError as e:
+            # Keep memory in step with disk: an entry that wasn't persisted isn't added
+            print("Failed to persist semantic cache", e)
+            return
+        matrix, count = store["matrix"], store["count"]
+        if count == matrix.shape[0]:
+            grown = np.empty((2 * count, matrix.shape[1]), dtype=np.float32)
+            grown[:count] = matrix
+            store["matrix"] = matrix = grown
+        matrix[count] = embedding
+        store["entries"].append(entry)
+        store["count"] = count + 1
 
 def generate_readme_fallback(brief: str, checks=None, attachments_meta=None, round_num=1):
     checks_text = "\\n".join(checks or [])
@@ -113,20 +588,17 @@ def generate_readme_fallback(brief: str, checks=None, attachments_meta=None, rou
 This README was generated as a fallback because the LLM did not return a valid response.
 """
 
-def generate_app_code(brief: str, attachments=None, checks=None, round_num=1, prev_readme=None):
+def _choose_model(brief, attachments, checks, round_num) -> str:
     """
-    Generate or revise an app using the Gemini API.
-    - round_num=1: build from scratch
-    - round_num=2: refactor based on new brief and previous README/code
+    Route simple requests (short first-round brief, no attachments) to the lite model.
+    Everything else, including all revisions, uses the full model.
     """
-    saved = decode_attachments(attachments or [])
-    attachments_meta = summarize_attachment_meta(saved)
+    if round_num == 1 and not attachments and len(brief) < LITE_MODEL_MAX_BRIEF_CHARS:
+        return GEMINI_LITE_MODEL
+    return GEMINI_MODEL
 
-    context_note = ""
-    if round_num == 2 and prev_readme:
-        context_note = f"\n### Previous README.md:\n{prev_readme}\n\nRevise and enhance this project according to the new brief below. The code must be modified to satisfy the new requirements.\n"
-        
-    user_prompt = f"""
+# Prompt pieces that never change between calls are built once at import
+_USER_PROMPT_TMPL = """
 You are a professional web developer assistant. You must output a single-file HTML application.
 
 ### Round
@@ -142,7 +614,7 @@ The attached files are available in the repository root. Reference them directly
 {attachments_meta}
 
 ### Evaluation checks (Ensure the generated app can pass these checks)
-{checks or []}
+{checks}
 
 ### Output format rules:
 1. Produce a complete, runnable, single-file HTML web app satisfying the brief.
@@ -154,59 +626,360 @@ The attached files are available in the repository root. Reference them directly
 5. Do not include any commentary or extra text outside the `index.html` and `---README.md---` sections.
 """
 
-    text = ""
-    try:
-        # Construct payload for the Gemini API call
-        payload = {
-            "contents": [{"parts": [{"text": user_prompt}]}],
-            "systemInstruction": {
-                "parts": [{"text": "You are a professional web developer assistant. Output must adhere strictly to the requested two-part format: 'index.html' content followed by '---README.md---' and then 'README.md' content. All code must be runnable in a single HTML file."}]
-            }
-        }
-        headers = {'Content-Type': 'application/json'}
-        params = {'key': GEMINI_API_KEY} 
+_ROUND2_CONTEXT_TMPL = "\n### Previous README.md:\n{prev_readme}\n\nRevise and enhance this project according to the new brief below. The code must be modified to satisfy the new requirements.\n"
+
+_SYSTEM_INSTRUCTION = {
+    "parts": [{"text": "You are a professional web developer assistant. Output must adhere strictly to the requested two-part format: 'index.html' content followed by '---README.md---' and then 'README.md' content. All code must be runnable in a single HTML file."}]
+}
+
+_HEADERS = {'Content-Type': 'application/json'}
 
-        # Call the Gemini API using requests (assuming the environment allows it)
-        response = requests.post(GEMINI_API_URL, headers=headers, params=params, json=payload, timeout=60)
+def _build_user_prompt(brief, checks, round_num, prev_readme, attachments_meta):
+    context_note = ""
+    if round_num == 2 and prev_readme:
+        context_note = _ROUND2_CONTEXT_TMPL.format_map({"prev_readme": prev_readme})
+
+    return _USER_PROMPT_TMPL.format_map({
+        "round_num": round_num,
+        "brief": brief,
+        "context_note": context_note,
+        "attachments_meta": attachments_meta,
+        "checks": checks or [],
+    })
+
+def _build_payload(user_prompt: str) -> bytes:
+    """
+    Serialize the request body once with orjson; retries and model escalation
+    resend the same bytes instead of re-encoding the prompt.
+    """
+    return orjson.dumps({
+        "contents": [{"parts": [{"text": user_prompt}]}],
+        "systemInstruction": _SYSTEM_INSTRUCTION,
+    })
+
+def _parse_sse_line(line, finish_reason):
+    """
+    Parse one SSE line (bytes or str) from streamGenerateContent.
+    Returns (text fragments, finish reason so far); non-data lines yield nothing.
+    """
+    # SSE frames look like: b'data: {...json...}'; skip blank keep-alive lines
+    if isinstance(line, str):
+        line = line.encode("utf-8")
+    if not line.startswith(b"data:"):
+        return [], finish_reason
+    chunk = orjson.loads(line[5:])
+    candidate = (chunk.get('candidates') or [{}])[0]
+    finish_reason = candidate.get('finishReason', finish_reason)
+    fragments = [part['text'] for part in candidate.get('content', {}).get('parts', []) if part.get('text')]
+    return fragments, finish_reason
+
+def _stream_gemini_text(payload: bytes, model: str = GEMINI_MODEL):
+    """
+    Call the streaming Gemini endpoint and yield text fragments as SSE frames arrive.
+    Raises if the stream ends without producing any text.
+    """
+    params = {'key': GEMINI_API_KEY, 'alt': 'sse'}
+
+    finish_reason = "UNKNOWN"
+    emitted = False
+    with _inflight, _session.post(GEMINI_API_URLS[model], headers=_HEADERS, params=params, data=payload, stream=True, timeout=60) as response:
         response.raise_for_status() # Raise an exception for bad status codes
+        for line in response.iter_lines():
+            fragments, finish_reason = _parse_sse_line(line, finish_reason)
+            for fragment in fragments:
+                emitted = True
+                yield fragment
 
-        result = response.json()
-        
-        # Extract the generated text from the response structure
-        text = result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
-        
-        if not text:
-             # Try to extract the reason for failure if possible, otherwise raise
-             safety_reason = result.get('candidates', [{}])[0].get('finishReason', 'UNKNOWN')
-             raise Exception(f"LLM response text was empty. Finish reason: {safety_reason}")
-            
-        print("✅ Generated code using Gemini API.")
+    if not emitted:
+        raise Exception(f"LLM response text was empty. Finish reason: {finish_reason}")
 
-    except requests.exceptions.RequestException as e:
-        print(f"⚠ Gemini API request failed ({e.__class__.__name__}), using fallback HTML instead: {e}")
+def _split_stream_by_file(fragments):
+    """
+    Re-chunk raw model output into (filename, text) pairs, switching from
+    index.html to README.md at the separator even if it straddles two fragments.
+    """
+    current = "index.html"
+    pending = ""
+    for fragment in fragments:
+        pending += fragment
+        if current == "index.html":
+            idx = pending.find(README_SEPARATOR)
+            if idx < 0:
+                # Hold back a tail that could be the start of a split separator
+                safe = len(pending) - (len(README_SEPARATOR) - 1)
+                if safe > 0:
+                    yield current, pending[:safe]
+                    pending = pending[safe:]
+                continue
+            if idx:
+                yield current, pending[:idx]
+            current = "README.md"
+            pending = pending[idx + len(README_SEPARATOR):]
+        if pending:
+            yield current, pending
+            pending = ""
+    if pending:
+        yield current, pending
+
+def generate_app_code_stream(brief: str, attachments=None, checks=None, round_num=1, prev_readme=None, use_cache=True):
+    """
+    Streaming variant of generate_app_code.
+    Yields (filename, text_chunk) pairs ("index.html" first, then "README.md") as soon as
+    Gemini produces them, so callers can render progressively. Chunks are always raw
+    model output (code fences are not stripped), so the cache is never read here; a
+    usable response is still stored for later generate_app_code calls.
+    - If the call fails before any output, the fallback files are yielded instead.
+    - Errors after output has started are raised to the caller.
+    - Always uses the full model: lite->full escalation needs the complete response,
+      which a stream cannot wait for.
+    """
+    saved = decode_attachments(attachments or [])
+    attachments_meta = summarize_attachment_meta(saved)
+    payload = _build_payload(_build_user_prompt(brief, checks, round_num, prev_readme, attachments_meta))
+
+    fragments = []
+    def collect(stream):
+        for fragment in stream:
+            fragments.append(fragment)
+            yield fragment
+
+    try:
+        yield from _split_stream_by_file(collect(_stream_gemini_text(payload, GEMINI_MODEL)))
     except Exception as e:
-        print(f"⚠ LLM API failed, using fallback HTML instead: {e}")
-        
-    if "---README.md---" in text:
-        code_part, readme_part = text.split("---README.md---", 1)
-        code_part = _strip_code_block(code_part)
-        readme_part = _strip_code_block(readme_part)
-    else:
-        # Fallback for when the model doesn't follow the separator rule
-        code_part = _strip_code_block(text)
-        readme_part = generate_readme_fallback(brief, checks, attachments_meta, round_num)
-        
-    # Generate the fallback HTML if no code was produced or an error occurred
-    if not code_part.strip().startswith('<'):
-         code_part = f"""
+        if fragments:
+            raise
+        print(f"⚠ Gemini API stream failed, using fallback files instead: {e}")
+        result, _ = _build_result("", brief, checks, round_num, attachments_meta, saved)
+        yield from result["files"].items()
+        return
+
+    print(f"✅ Generated code using Gemini API ({GEMINI_MODEL}, streamed).")
+    if use_cache:
+        result, used_fallback = _build_result("".join(fragments), brief, checks, round_num, attachments_meta, saved)
+        if not used_fallback:
+            # Keyed like generate_app_code's lookup so a later non-streaming call hits it
+            model = _choose_model(brief, attachments, checks, round_num)
+            _store_cached_result(CACHE_DIR / f"{_prompt_cache_key(brief, checks, round_num, prev_readme, attachments_meta, model)}.json", result)
+
+def _lookup_cached_generation(brief, checks, round_num, prev_readme, attachments_meta, model):
+    """
+    Check the exact-match cache, then the semantic cache.
+    Returns (cached result or None, cache_path, embedding, context_key); the last
+    three are needed to store a fresh generation afterwards.
+    """
+    cache_path = CACHE_DIR / f"{_prompt_cache_key(brief, checks, round_num, prev_readme, attachments_meta, model)}.json"
+    cached = _load_cached_result(cache_path)
+    if cached is not None:
+        print("✅ Using cached generation for identical prompt.")
+        return cached, cache_path, None, None
+
+    embedding = _embed_brief(brief)
+    context_key = None
+    if embedding is not None:
+        context_key = _semantic_context_key(checks, round_num, prev_readme, attachments_meta, model)
+        cached = _semantic_cache_lookup(embedding, context_key)
+        if cached is not None:
+            print("✅ Using cached generation for a semantically similar brief.")
+    return cached, cache_path, embedding, context_key
+
+_FALLBACK_HTML = """
 <html>
   <head><title>Fallback App</title></head>
   <body>
     <h1>Hello (fallback)</h1>
-    <p>This app was generated as a fallback because the LLM failed to produce valid HTML. Brief: {brief}</p>
+    <p>This app was generated as a fallback because the LLM failed to produce valid HTML. Brief: __BRIEF__</p>
   </body>
 </html>
 """
 
+def _build_result(text, brief, checks, round_num, attachments_meta, saved):
+    """
+    Turn raw model output into the {"files", "attachments"} result, falling back
+    to generated HTML/README when the output is missing or malformed.
+    Returns (result, used_fallback); results with fallback content must not be cached.
+    """
+    used_fallback = False
+    idx = text.find(README_SEPARATOR)
+    if idx >= 0:
+        # Scan both halves in place instead of splitting the response into copies
+        code_part = _strip_code_block(text, 0, idx)
+        readme_part = _strip_code_block(text, idx + len(README_SEPARATOR))
+    else:
+        # Fallback for when the model doesn't follow the separator rule
+        code_part = _strip_code_block(text)
+        readme_part = generate_readme_fallback(brief, checks, attachments_meta, round_num)
+        used_fallback = True
+
+    # Generate the fallback HTML if no code was produced or an error occurred
+    if not code_part.strip().startswith('<'):
+        # The brief is user-supplied: escape it so it can't inject markup into the page
+        code_part = _FALLBACK_HTML.replace("__BRIEF__", html.escape(brief))
+        used_fallback = True
+
     files = {"index.html": code_part, "README.md": readme_part}
-    return {"files": files, "attachments": saved}
+    return {"files": files, "attachments": saved}, used_fallback
+
+def _store_generation(result, cache_path, embedding, context_key):
+    _store_cached_result(cache_path, result)
+    if embedding is not None:
+        _semantic_cache_add(embedding, context_key, cache_path)
+
+def _generate_text(payload: bytes, model: str) -> str:
+    """
+    Call Gemini and return the full response text, or "" if the call failed.
+    """
+    try:
+        # Stream the response and assemble the full text
+        text = "".join(_stream_gemini_text(payload, model))
+        print(f"✅ Generated code using Gemini API ({model}).")
+        return text
+    except requests.exceptions.RequestException as e:
+        print(f"⚠ Gemini API request failed ({e.__class__.__name__}), using fallback HTML instead: {e}")
+    except Exception as e:
+        print(f"⚠ LLM API failed, using fallback HTML instead: {e}")
+    return ""
+
+def _generate_text_with_escalation(payload: bytes, model: str) -> str:
+    text = _generate_text(payload, model)
+    if model != GEMINI_MODEL and README_SEPARATOR not in text:
+        # The lite model failed or ignored the output format; escalate once to the full model
+        print(f"⚠ {model} did not return a usable response, retrying with {GEMINI_MODEL}")
+        text = _generate_text(payload, GEMINI_MODEL)
+    return text
+
+def generate_app_code(brief: str, attachments=None, checks=None, round_num=1, prev_readme=None, use_cache=True):
+    """
+    Generate or revise an app using the Gemini API.
+    - round_num=1: build from scratch
+    - round_num=2: refactor based on new brief and previous README/code
+    - use_cache=False: bypass the on-disk prompt cache and always call the API
+    """
+    saved = decode_attachments(attachments or [])
+    attachments_meta = summarize_attachment_meta(saved)
+
+    model = _choose_model(brief, attachments, checks, round_num)
+
+    if use_cache:
+        cached, cache_path, embedding, context_key = _lookup_cached_generation(
+            brief, checks, round_num, prev_readme, attachments_meta, model)
+        if cached is not None:
+            return cached
+
+    payload = _build_payload(_build_user_prompt(brief, checks, round_num, prev_readme, attachments_meta))
+
+    text = _generate_text_with_escalation(payload, model)
+
+    result, used_fallback = _build_result(text, brief, checks, round_num, attachments_meta, saved)
+    # Only cache real generations; fallbacks (API errors, refusals, malformed output)
+    # should be retried on the next call
+    if use_cache and not used_fallback:
+        _store_generation(result, cache_path, embedding, context_key)
+    return result
+
+async def _fetch_gemini_text_async(payload: bytes, client: httpx.AsyncClient, model: str) -> str:
+    """
+    Async counterpart of _stream_gemini_text; returns the assembled text.
+    """
+    params = {'key': GEMINI_API_KEY, 'alt': 'sse'}
+
+    finish_reason = "UNKNOWN"
+    fragments = []
+    async with _async_inflight_slot(), client.stream("POST", GEMINI_API_URLS[model], headers=_HEADERS, params=params, content=payload, timeout=60) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            new_fragments, finish_reason = _parse_sse_line(line, finish_reason)
+            fragments.extend(new_fragments)
+
+    if not fragments:
+        raise Exception(f"LLM response text was empty. Finish reason: {finish_reason}")
+    return "".join(fragments)
+
+def _retry_delay(attempt: int, response=None) -> float:
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), MAX_RETRY_AFTER_SECONDS)
+    return min(2 ** attempt, 8) + random.uniform(0, 0.5)
+
+async def _generate_text_async(payload: bytes, client: httpx.AsyncClient, model: str) -> str:
+    """
+    Async counterpart of _generate_text, with the same retry policy as the sync session.
+    """
+    try:
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                text = await _fetch_gemini_text_async(payload, client, model)
+                break
+            except httpx.HTTPStatusError as e:
+                if attempt == MAX_RETRIES or e.response.status_code not in RETRY_STATUSES:
+                    raise
+                delay = _retry_delay(attempt, e.response)
+            except httpx.TransportError:
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = _retry_delay(attempt)
+            print(f"⚠ Gemini API attempt {attempt+1} failed, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        print(f"✅ Generated code using Gemini API ({model}).")
+        return text
+    except httpx.HTTPError as e:
+        print(f"⚠ Gemini API request failed ({e.__class__.__name__}), using fallback HTML instead: {e}")
+    except Exception as e:
+        print(f"⚠ LLM API failed, using fallback HTML instead: {e}")
+    return ""
+
+async def _generate_text_with_escalation_async(payload: bytes, client: httpx.AsyncClient, model: str) -> str:
+    text = await _generate_text_async(payload, client, model)
+    if model != GEMINI_MODEL and README_SEPARATOR not in text:
+        # The lite model failed or ignored the output format; escalate once to the full model
+        print(f"⚠ {model} did not return a usable response, retrying with {GEMINI_MODEL}")
+        text = await _generate_text_async(payload, client, GEMINI_MODEL)
+    return text
+
+async def generate_app_code_async(brief: str, attachments=None, checks=None, round_num=1, prev_readme=None,
+                                  use_cache=True, client: httpx.AsyncClient = None):
+    """
+    Async version of generate_app_code, so several generations can share one event loop.
+    Pass a shared httpx.AsyncClient to reuse connections across concurrent calls.
+    """
+    model = _choose_model(brief, attachments, checks, round_num)
+
+    def prepare():
+        saved = decode_attachments(attachments or [])
+        attachments_meta = summarize_attachment_meta(saved)
+        lookup = None
+        if use_cache:
+            lookup = _lookup_cached_generation(brief, checks, round_num, prev_readme, attachments_meta, model)
+        return saved, attachments_meta, lookup
+
+    # Attachment decoding and cache lookups touch the disk; keep them off the event loop
+    saved, attachments_meta, lookup = await asyncio.to_thread(prepare)
+    if lookup is not None and lookup[0] is not None:
+        return lookup[0]
+
+    payload = _build_payload(_build_user_prompt(brief, checks, round_num, prev_readme, attachments_meta))
+
+    if client is None:
+        async with httpx.AsyncClient() as own_client:
+            text = await _generate_text_with_escalation_async(payload, own_client, model)
+    else:
+        text = await _generate_text_with_escalation_async(payload, client, model)
+
+    result, used_fallback = _build_result(text, brief, checks, round_num, attachments_meta, saved)
+    if lookup is not None and not used_fallback:
+        _, cache_path, embedding, context_key = lookup
+        await asyncio.to_thread(_store_generation, result, cache_path, embedding, context_key)
+    return result
+
+async def generate_apps_async(briefs, **kwargs):
+    """
+    Generate one app per brief concurrently; kwargs are passed to every call.
+    Wall time is roughly that of the slowest generation instead of the sum.
+    """
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=MAX_INFLIGHT_REQUESTS)) as client:
+        return await asyncio.gather(*[generate_app_code_async(b, client=client, **kwargs) for b in briefs])
+
+def generate_apps(briefs, **kwargs):
+    """
+    Synchronous wrapper around generate_apps_async for callers without an event loop.
+    """
+    return asyncio.run(generate_apps_async(briefs, **kwargs))
@@ -1,7 +1,7 @@
 from fastapi import FastAPI, Request, BackgroundTasks
 import os, json, base64
 from dotenv import load_dotenv
-from app.llm_generator import generate_app_code, decode_attachments
+from app.llm_generator import generate_app_code, decode_attachments, is_text_attachment
 from app.github_utils import (
     create_repo,
     create_or_update_file,
@@ -73,7 +73,7 @@ def process_request(data):
             try:
                 with open(att["path"], "rb") as f:
                     content_bytes = f.read()
-                if att["mime"].startswith("text") or att["name"].endswith((".md", ".csv", ".json", ".txt")):
+                if is_text_attachment(att["name"], att["mime"]):
                     text = content_bytes.decode("utf-8", errors="ignore")
                     create_or_update_file(repo, path, text, f"Add attachment {path}")
                 else: